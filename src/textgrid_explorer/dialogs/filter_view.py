@@ -28,6 +28,8 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import (
     Qt,
     Signal,
+    QTimer,
+    QSignalBlocker,
 )
 
 class FilterByDialog(QDialog):
@@ -36,6 +38,7 @@ class FilterByDialog(QDialog):
     def __init__(self, parent, fields=None, default_value=''):
         super().__init__(parent)
         self._fields = fields
+        self._last_emitted = None
         self.default_value = default_value
         if fields is None:
             self._fields = []
@@ -43,6 +46,12 @@ class FilterByDialog(QDialog):
         self.setMinimumWidth(400)
         self.init_ui()
 
+        # Collapse bursts of changes (e.g., typing) into a single emission
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(150)
+        self._debounce.timeout.connect(self._emit_now)
+
     def init_ui(self):
         # Headers
         self.headers_box = QComboBox(self)
@@ -85,9 +94,18 @@ class FilterByDialog(QDialog):
         self.setLayout(layout)
 
     def on_changed(self):
+        self._debounce.start()
+
+    def _emit_now(self):
         dict_ = self.to_dict()
+        if dict_ == self._last_emitted:
+            return
+        self._last_emitted = dict_
         self.filtered_by.emit(dict_)
 
+    def set_debounce_interval(self, msec: int) -> None:
+        self._debounce.setInterval(msec)
+
     def on_clear(self):
         self.line_ed.setText('')
 
@@ -95,10 +113,25 @@ class FilterByDialog(QDialog):
         return self._fields
 
     def set_fields(self, fields):
-        if not self._fields == fields:
-            self._fields = fields
-            self.headers_box.clear()
-            self.headers_box.addItems(self._fields)
+        if self._fields == fields:
+            return
+
+        # Only rebuild the items after the common prefix
+        prefix_len = 0
+        for old, new in zip(self._fields, fields):
+            if old != new:
+                break
+            prefix_len += 1
+
+        current_text = self.headers_box.currentText()
+        with QSignalBlocker(self.headers_box):
+            for i in range(len(self._fields) - 1, prefix_len - 1, -1):
+                self.headers_box.removeItem(i)
+            self.headers_box.addItems(fields[prefix_len:])
+        self._fields = list(fields)
+
+        if self.headers_box.currentText() != current_text:
+            self.on_changed()
 
     def set_index_field(self, index: int) -> None:
         self.headers_box.setCurrentIndex(index)
@@ -15,8 +15,12 @@
 #   with this program.  If not, see <https://www.gnu.org/licenses/>.
 import re
 import shutil
+import string
+import functools
 import subprocess
+from dataclasses import dataclass
 from importlib import resources
+from typing import Tuple
 
 from PySide6.QtWidgets import (
     QMainWindow,
@@ -33,7 +37,6 @@ from PySide6.QtCore import (
     Slot,
     QSettings,
     QRegularExpression,
-    QItemSelectionRange,
     QSortFilterProxyModel,
 )
 from PySide6.QtGui import (
@@ -54,13 +57,44 @@ from textgrid_explorer import utils
 resources_dir = resources.files('textgrid_explorer.resources')
 settings = QSettings('Gilgamesh', 'textgrid_explorer')
 
+_EXT_CHARS = frozenset(string.ascii_letters + string.digits)
+_METACHARS = frozenset('.^$*+?{}[]|()\\')
+
+@functools.lru_cache(maxsize=32)
+def _replace_pattern(pattern):
+    """
+    Return the compiled regex used by Replace and Replace All. The most
+    recent patterns are kept compiled.
+    """
+    return re.compile(pattern)
+
+@dataclass(frozen=True)
+class _PraatConfig:
+    """
+    Snapshot of the Praat preferences used by `Open selection in Praat`.
+    """
+    path: str
+    extensions: Tuple[str, ...]
+    maximize: bool
+    plugins: bool
+
+    @classmethod
+    def from_settings(cls):
+        extensions = settings.value('praat_sound_extensions', '')
+        return cls(
+            path=settings.value('praat_path', ''),
+            extensions=tuple(ext for ext in extensions.split(';') if ext),
+            maximize=bool(int(settings.value('praat_maximize_audibility', 0))), # On Linux it is a str
+            plugins=bool(int(settings.value('praat_activate_plugins', 0))),
+        )
+
 class EditorView(QWidget):
     save_changes = Signal(bool)
 
     def __init__(self, parent):
         super().__init__(parent)
         self.init_ui()
-        self._modified_indexes = set()
+        self._modified_cells = set()
 
     def init_ui(self):
         self.table_view = QTableView()
@@ -76,12 +110,12 @@ class EditorView(QWidget):
         self.setLayout(box_layout)
 
     def on_changed_indexes(self, topleft, bottomright, roles):
-        if not topleft.isValid() or not topleft.isValid():
+        if not topleft.isValid() or not bottomright.isValid():
             return
-        selection_range = QItemSelectionRange(topleft, bottomright)
-        indexes = selection_range.indexes()
-        for index in indexes:
-            self._modified_indexes.add(index)
+        columns = range(topleft.column(), bottomright.column() + 1)
+        for row in range(topleft.row(), bottomright.row() + 1):
+            for column in columns:
+                self._modified_cells.add((row, column))
         self.save_changes.emit(True)
 
     def set_table_data(self, headers, data):
@@ -102,19 +136,19 @@ class EditorView(QWidget):
     def model(self):
         return self.table_view.model()
 
-    def modified_indexes(self):
+    def modified_cells(self):
         """
-        QModelIndex objects corresponding to all modified (unsaved) data
-        cells in the model
+        (row, column) pairs corresponding to all modified (unsaved) data
+        cells in the source model
         """
-        return self._modified_indexes
+        return self._modified_cells
 
-    def clear_modified_indexes(self):
+    def clear_modified_cells(self):
         """
-        Clear the internal list of modified indexes, typically called after
+        Clear the internal set of modified cells, typically called after
         a successful save operation.
         """
-        self._modified_indexes.clear()
+        self._modified_cells.clear()
         self.save_changes.emit(False)
 
 class TGExplorer(QMainWindow):
@@ -124,6 +158,11 @@ class TGExplorer(QMainWindow):
         self.setWindowTitle('TextGrid Explorer')
         self.setMinimumSize(800, 500)
         #self.showMaximized()
+        self._find_qre = None
+        self._filter_state = None
+        self._praat_cfg = _PraatConfig.from_settings()
+        self._praat_executable = None
+        self._sound_path_cache = {}
         self.create_dialogs()
         self.create_actions()
         self.init_ui()
@@ -191,6 +230,21 @@ class TGExplorer(QMainWindow):
         self.preferences_act = QAction(self.tr('&Preferences...'), self)
         self.preferences_act.triggered.connect(self.popup_preferences_dlg)
 
+        # Actions that are only available while a project is open
+        self._project_actions = (
+            self.save_changes_act,
+            self.close_project_act,
+            self.project_settings_act,
+            self.open_project_act,
+            self.open_praat_act,
+            self.filter_act,
+            self.find_and_replace_act,
+            self.find_act,
+            self.map_annotation_act,
+            self.sort_az_act,
+            self.sort_za_act,
+        )
+
     def create_menubar(self):
         menu_bar = QMenuBar()
 
@@ -257,8 +311,8 @@ class TGExplorer(QMainWindow):
         self.map_annotations_dlg.accepted.connect(self.on_map_annotations)
 
     def closeEvent(self, e):
-        indexes = self.editor_view.modified_indexes()
-        if indexes:
+        cells = self.editor_view.modified_cells()
+        if cells:
             response = QMessageBox.question(
                 self,
                 'Save Changes?',
@@ -283,10 +337,7 @@ class TGExplorer(QMainWindow):
         self.preferences_dlg.open()
 
     def popup_filter_dlg(self):
-        proxy_model = self.editor_view.table_view.model()
-        ncols = proxy_model.columnCount()
-        orientation = Qt.Orientation.Horizontal
-        fields = [proxy_model.headerData(i, orientation) for i in range(ncols)]
+        fields = self.editor_view.table_view.model().sourceModel().headers()
 
         self.simple_filter_dlg.set_fields(fields)
         index = self.editor_view.table_view.selectionModel().currentIndex()
@@ -297,23 +348,20 @@ class TGExplorer(QMainWindow):
 
     def popup_find_and_replace_dlg(self, tab_index=0):
         column_index = -1
-        column_names = []
         find_pattern = ''
 
         # Get column names
-        model = self.editor_view.table_view.model()
-        for i in range(model.columnCount()):
-            column_names.append(
-                model.headerData(i, Qt.Orientation.Horizontal)
-            )
+        column_names = self.editor_view.table_view.model().sourceModel().headers()
 
         # On selection
-        indexes = self.editor_view.table_view.selectedIndexes()
-        if indexes:
-            index = indexes[0] #topleft selection
+        sel_model = self.editor_view.table_view.selectionModel()
+        index = sel_model.currentIndex()
+        if index.isValid():
             column_index = index.column()
 
-            if len(indexes) == 1: # If selected on cell
+            selection = sel_model.selection()
+            if (len(selection) == 1 and selection[0].width() == 1
+                    and selection[0].height() == 1): # If selected on cell
                 find_pattern = index.data()
 
         ## Fill up find tab
@@ -328,10 +376,7 @@ class TGExplorer(QMainWindow):
         """
         Prepare and show non-modal dialog.
         """
-        proxy_model = self.editor_view.table_view.model()
-        ncols = proxy_model.columnCount()
-        orientation = Qt.Orientation.Horizontal
-        fields = [proxy_model.headerData(i, orientation) for i in range(ncols)]
+        fields = self.editor_view.table_view.model().sourceModel().headers()
 
         self.map_annotations_dlg.set_fields(fields)
         self.map_annotations_dlg.show()
@@ -343,39 +388,68 @@ class TGExplorer(QMainWindow):
         """
         table_view = self.editor_view.table_view
         proxy_model = table_view.model()
-        source_model = proxy_model.sourceModel()
 
         # 1. From the QDialog, get the column index and the search pattern
         dlg_dict = self.find_and_replace_dlg.data()
         col_ind = dlg_dict['column_index']
         pattern = dlg_dict['pattern']
 
+        nrows = proxy_model.rowCount()
+        if not pattern or col_ind < 0 or nrows == 0:
+            return False
+
         # 2. From the QTableView, get the current selected row
         row_ind = 0
         proxy_indexes = table_view.selectedIndexes()
         if proxy_indexes:
-            current_source_index = proxy_model.mapToSource(proxy_indexes[0])
-            row_ind = current_source_index.row() + step
+            row_ind = (proxy_indexes[0].row() + step) % nrows
 
         # 3. Find the next item moving on from the current selected row,
-        # the specified column and the pattern
-        p = re.compile(pattern)
-        for i in range(row_ind, source_model.rowCount()):
-            source_index = source_model.index(i, col_ind)
-            cell_text = source_index.data()
-            if not p.search(cell_text):
-                continue
+        # the specified column and the pattern. The scan runs in Qt over the
+        # visible rows and wraps around at the end of the table. Patterns
+        # without metacharacters are plain substring searches.
+        flags = Qt.MatchFlag.MatchCaseSensitive | Qt.MatchFlag.MatchWrap
+        if _METACHARS.isdisjoint(pattern):
+            value = pattern
+            flags |= Qt.MatchFlag.MatchContains
+        else:
+            value = self.find_regex(pattern)
+            if not value.isValid():
+                return False
+            flags |= Qt.MatchFlag.MatchRegularExpression
+
+        proxy_indexes = proxy_model.match(
+            proxy_model.index(row_ind, col_ind),
+            Qt.ItemDataRole.DisplayRole,
+            value,
+            1,
+            flags
+        )
+        if not proxy_indexes:
+            return False
 
-            proxy_index = proxy_model.mapFromSource(source_index)
-            if not proxy_index.isValid():
-                continue
+        proxy_index = proxy_indexes[0]
+        sel_model = table_view.selectionModel()
+        sel_model.select(proxy_index, sel_model.SelectionFlag.ClearAndSelect)
+        table_view.setCurrentIndex(proxy_index) # Focus
+        table_view.scrollTo(proxy_index)
+        return True
 
-            sel_model = table_view.selectionModel()
-            sel_model.select(proxy_index, sel_model.SelectionFlag.ClearAndSelect)
-            table_view.setCurrentIndex(proxy_index) # Focus
-            table_view.scrollTo(proxy_index)
-            return True
-        return False
+    def find_regex(self, pattern):
+        """
+        Return the `QRegularExpression` for `pattern`. The last expression is
+        kept, so it is compiled (and JIT-optimized) once while the pattern
+        does not change. Like Python's `re`, `\\w`, `\\d` and `\\b` match any
+        Unicode character of their class (e.g. IPA symbols).
+        """
+        if self._find_qre is None or self._find_qre.pattern() != pattern:
+            qre = QRegularExpression(
+                pattern, QRegularExpression.PatternOption.UseUnicodePropertiesOption
+            )
+            if qre.isValid():
+                qre.optimize()
+            self._find_qre = qre
+        return self._find_qre
 
     def on_find_all(self):
         print('Find All')
@@ -387,19 +461,23 @@ class TGExplorer(QMainWindow):
         """
         table_view = self.editor_view.table_view
 
-        # 1. Use the find to match a value
+        # 1. From the QDialog, get the search pattern and the replace.
+        #    Find matches with Qt (PCRE2) but Replace uses Python's re,
+        #    which rejects some patterns Qt accepts (e.g. \p{L})
+        dlg_dict = self.find_and_replace_dlg.data()
+        pattern = dlg_dict['pattern']
+        repl = dlg_dict['replace']
+        try:
+            compiled = _replace_pattern(pattern)
+        except re.error:
+            return False
+
+        # 2. Use the find to match a value
         match = self.on_find(0)
 
         if not match:
             return False
 
-        # 2. From the QDialog, get the column index, the search pattern
-        #    and the replace
-        dlg_dict = self.find_and_replace_dlg.data()
-        col_ind = dlg_dict['column_index']
-        pattern = dlg_dict['pattern']
-        repl = dlg_dict['replace']
-
         # 3. Once match is found, replace the item
         proxy_model = table_view.model()
         proxy_indexes = table_view.selectedIndexes()
@@ -410,7 +488,7 @@ class TGExplorer(QMainWindow):
         source_index = proxy_model.mapToSource(proxy_index)
 
         source_model = proxy_model.sourceModel()
-        source_model.replace([source_index], pattern, repl)
+        source_model.replace([source_index], compiled, repl)
         return True
 
     def on_replace_all(self):
@@ -425,21 +503,31 @@ class TGExplorer(QMainWindow):
         col_ind = dlg_dict['column_index']
         pattern = dlg_dict['pattern']
         repl = dlg_dict['replace']
+        if not pattern or col_ind < 0:
+            return False
+
+        # Replace uses Python's re, not Qt's regex engine like Find
+        try:
+            compiled = _replace_pattern(pattern)
+        except re.error:
+            return False
 
-        # 2. Get the all the indexes from the selected column
+        # 2. Get the source rows visible in the table. If no rows are
+        #    filtered out, the model walks the whole column by itself.
         proxy_model = table_view.model()
         source_model = proxy_model.sourceModel()
 
-        source_indexes = []
-        for i in range(proxy_model.rowCount()):
-            proxy_item = proxy_model.index(i, col_ind)
-            source_item = proxy_model.mapToSource(proxy_item)
-            if not source_item.isValid():
-                continue
-            source_indexes.append(source_item)
+        source_rows = None
+        if proxy_model.rowCount() != source_model.rowCount():
+            source_rows = [
+                proxy_model.mapToSource(proxy_model.index(i, 0)).row()
+                for i in range(proxy_model.rowCount())
+            ]
 
         # 3. Replace All
-        source_model.replace(source_indexes, pattern, repl)
+        source_model.replace_column(
+            col_ind, compiled, repl, source_rows
+        )
         return True
 
     def on_map_annotations(self):
@@ -453,12 +541,7 @@ class TGExplorer(QMainWindow):
 
     def on_open_praat(self):
         table_view = self.editor_view.table_view
-        indexes = table_view.selectedIndexes()
-        if not indexes:
-            return
-
-        index = indexes[0]
-
+        index = table_view.selectionModel().currentIndex()
         if not index.isValid():
             return
 
@@ -469,29 +552,27 @@ class TGExplorer(QMainWindow):
         if item is None:
             return
 
-        sound_extensions = settings.value('praat_sound_extensions').split(';')
-        sound_path = ''
+        praat_cfg = self._praat_cfg
         textgrid_path = item.textgrid().file_path
-        for sound_ext in sound_extensions:
-            sound_path_tmp = textgrid_path.with_suffix(sound_ext)
-            if sound_path_tmp.is_file():
-                sound_path = sound_path_tmp
-                break
-
-        praat_path_ = settings.value('praat_path')
-        praat_path = shutil.which(praat_path_)
+        sound_path = self._sound_path_cache.get(textgrid_path, '')
+        if not sound_path:
+            for sound_ext in praat_cfg.extensions:
+                sound_path_tmp = textgrid_path.with_suffix(sound_ext)
+                if sound_path_tmp.is_file():
+                    sound_path = sound_path_tmp
+                    self._sound_path_cache[textgrid_path] = sound_path
+                    break
+
+        if self._praat_executable is None:
+            self._praat_executable = shutil.which(praat_cfg.path)
+        praat_path = self._praat_executable
         if praat_path is None:
             QMessageBox.critical(
                 self,
                 'Open selection in Praat',
                 'It seems like the <b>Praat path</b> does not exist. Please, go to <b>Edit > Preferences</br'
             )
-
-        maximize_audibility = settings.value('praat_maximize_audibility')
-        maximize_audibility = int(maximize_audibility)
-
-        activate_plugins = settings.value('praat_activate_plugins') # On Linux it is a str'
-        activate_plugins = bool(int(activate_plugins))
+            return
 
         script_path = resources_dir / 'open_file.praat'
         args = [
@@ -502,28 +583,19 @@ class TGExplorer(QMainWindow):
             script_path,
             textgrid_path,
             sound_path,
-            str(maximize_audibility),
+            str(int(praat_cfg.maximize)),
             str(item.tier().index + 1),
             str(item.xmin),
             str(item.xmax)
         ]
 
-        if activate_plugins:
+        if praat_cfg.plugins:
             args.pop(2) # Remove --no-plugins
         subprocess.run(args)
 
     def on_enabled_buttons(self, b):
-        self.save_changes_act.setEnabled(b)
-        self.close_project_act.setEnabled(b)
-        self.project_settings_act.setEnabled(b)
-        self.open_project_act.setEnabled(b)
-        self.open_praat_act.setEnabled(b)
-        self.filter_act.setEnabled(b)
-        self.find_and_replace_act.setEnabled(b)
-        self.find_act.setEnabled(b)
-        self.map_annotation_act.setEnabled(b)
-        self.sort_az_act.setEnabled(b)
-        self.sort_za_act.setEnabled(b)
+        for action in self._project_actions:
+            action.setEnabled(b)
 
     def on_open_project(self):
         pass
@@ -532,8 +604,8 @@ class TGExplorer(QMainWindow):
         pass
 
     def on_close_project(self):
-        indexes = self.editor_view.modified_indexes()
-        if indexes:
+        cells = self.editor_view.modified_cells()
+        if cells:
             response = QMessageBox.question(
                 self,
                 'Save Changes?',
@@ -543,8 +615,9 @@ class TGExplorer(QMainWindow):
                 self.on_save_changes()
 
         self.editor_view.set_table_data([], [])
+        self._sound_path_cache.clear()
         self.on_enabled_buttons(False)
-        self.editor_view.clear_modified_indexes()
+        self.editor_view.clear_modified_cells()
 
     def on_load_data(self):
         # Get variables from a dialog
@@ -574,32 +647,39 @@ class TGExplorer(QMainWindow):
 
     @Slot(dict)
     def on_filter_rows(self, dict_):
+        filter_state = (
+            dict_['column_index'], dict_['pattern'], dict_['is_regular_expression']
+        )
+        if filter_state == self._filter_state:
+            return
+
         proxy_model = self.editor_view.model()
         if dict_['is_regular_expression']:
             regex_pattern = QRegularExpression(dict_['pattern'])
             if not regex_pattern.isValid():
                 return
+            regex_pattern.setPatternOptions(
+                QRegularExpression.PatternOption.UseUnicodePropertiesOption
+            )
+            regex_pattern.optimize()
             proxy_model.setFilterKeyColumn(dict_['column_index'])
-            proxy_model.setFilterRegularExpression(dict_['pattern'])
+            proxy_model.setFilterRegularExpression(regex_pattern)
         else:
             proxy_model.setFilterKeyColumn(dict_['column_index'])
             proxy_model.setFilterFixedString(dict_['pattern'])
+        self._filter_state = filter_state
 
     def on_sort_az(self):
         table_view = self.editor_view.table_view
-        indexes = table_view.selectedIndexes()
-        if indexes:
-            topleft_index = indexes[0]
-            column_index = topleft_index.column()
-            table_view.sortByColumn(column_index, Qt.SortOrder.AscendingOrder)
+        index = table_view.selectionModel().currentIndex()
+        if index.isValid():
+            table_view.sortByColumn(index.column(), Qt.SortOrder.AscendingOrder)
 
     def on_sort_za(self):
         table_view = self.editor_view.table_view
-        indexes = table_view.selectedIndexes()
-        if indexes:
-            topleft_index = indexes[0]
-            column_index = topleft_index.column()
-            table_view.sortByColumn(column_index, Qt.SortOrder.DescendingOrder)
+        index = table_view.selectionModel().currentIndex()
+        if index.isValid():
+            table_view.sortByColumn(index.column(), Qt.SortOrder.DescendingOrder)
 
     def on_sorting_act(self, current_index, previous_index):
         """
@@ -609,43 +689,52 @@ class TGExplorer(QMainWindow):
         if not current_index.isValid():
             return
         column_index = current_index.column()
-        column_name = current_index.model().headerData(column_index, Qt.Orientation.Horizontal)
+        column_name = self.editor_view.model().sourceModel().header_name(column_index)
         self.sort_az_act.setText(f'Sort by column "{column_name}" (A to Z)')
         self.sort_za_act.setText(f'Sort by column "{column_name}" (Z to A)')
 
     def on_save_changes(self):
-        tmp_paths = set()
-        indexes = self.editor_view.modified_indexes()
-        for index in indexes:
-            src_model = index.model()
-            src_model.setData(index, False, Qt.ItemDataRole.ForegroundRole)
+        cells = self.editor_view.modified_cells()
+        src_model = self.editor_view.model().sourceModel()
 
-            item = index.data(Qt.ItemDataRole.UserRole)
+        # Group the modified cells by TextGrid
+        textgrids = {}
+        for row, column in cells:
+            item = src_model.index(row, column).data(Qt.ItemDataRole.UserRole)
             textgrid = item.textgrid()
-            if textgrid.file_path in tmp_paths:
-                continue
-            textgrid.write(textgrid.file_path) #Save path
-            tmp_paths.add(textgrid.file_path)
-        self.editor_view.clear_modified_indexes()
+            textgrids.setdefault(textgrid.file_path, textgrid)
+
+        src_model.clear_modified_flags(cells)
+
+        for path, textgrid in textgrids.items():
+            textgrid.write(path) #Save path
+        self.editor_view.clear_modified_cells()
 
     def on_preferences(self):
         dict_ = self.preferences_dlg.to_dict()
 
         # Normalize extensions input
-        ext_pattern = re.compile(r'\.?[a-zA-Z0-9]+')
         ext_list = dict_['praat_sound_extensions'].split(';')
-        norm_ext_list = []
+        seen = {} # Ordered set
         for sound_ext in ext_list:
             sound_ext = sound_ext.strip()
-            if not ext_pattern.match(sound_ext):
+            if sound_ext.startswith('.'):
+                sound_ext = sound_ext[1:]
+            if not sound_ext or not _EXT_CHARS.issuperset(sound_ext):
                 continue
-            sound_ext = sound_ext if sound_ext.startswith('.') else f'.{sound_ext}'
-            if sound_ext in norm_ext_list:
-                continue
-            norm_ext_list.append(sound_ext)
-        extensions_str = ';'.join(norm_ext_list)
+            seen.setdefault(f'.{sound_ext}', None)
+        extensions_str = ';'.join(seen)
+        self._sound_path_cache.clear()
 
         settings.setValue('praat_path', dict_['praat_path'])
         settings.setValue('praat_sound_extensions', extensions_str)
         settings.setValue('praat_maximize_audibility', int(dict_['praat_maximize_audibility']))
         settings.setValue('praat_activate_plugins', int(dict_['praat_activate_plugins']))
+
+        self._praat_executable = None
+        self._praat_cfg = _PraatConfig(
+            path=dict_['praat_path'],
+            extensions=tuple(seen),
+            maximize=bool(dict_['praat_maximize_audibility']),
+            plugins=bool(dict_['praat_activate_plugins']),
+        )
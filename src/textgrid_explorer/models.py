@@ -36,10 +36,22 @@ class TGTableModel(QAbstractTableModel):
         self._headers = []
 
     def set_full_dataset(self, headers, new_data):
+        """
+        Replace the whole table. `new_data` is used as-is (not copied) and
+        the views are refreshed once through a model reset.
+        """
         self.beginResetModel()
-        self._headers = headers
-        self._data = new_data
-        self.endResetModel()
+        try:
+            self._headers = list(headers)
+            self._data = new_data
+        finally:
+            self.endResetModel()
+
+    def headers(self):
+        return self._headers
+
+    def header_name(self, section):
+        return self._headers[section]
 
     def rowCount(self, index=QModelIndex()):
         return len(self._data)
@@ -141,6 +153,49 @@ class TGTableModel(QAbstractTableModel):
 
         return False
 
+    def clear_modified_flags(self, cells):
+        '''
+        Reset the modified flag of the items at the given cells.
+
+        Instead of notifying the views once per cell, a single `dataChanged`
+        signal is emitted for each run of contiguous rows within a column.
+
+        Parameters
+        ----------
+        cells : iterable of (int, int)
+            The (row, column) pairs of the items to reset.
+        '''
+        rows_by_column = {}
+        for row, column in cells:
+            item = self._data[row][column]
+            if column > 0 and item is not None:
+                item.modified = False
+            rows_by_column.setdefault(column, []).append(row)
+
+        roles = [Qt.ItemDataRole.ForegroundRole]
+        for column, rows in rows_by_column.items():
+            self._notify_rows(column, rows, roles)
+
+    def _notify_rows(self, column, rows, roles=None):
+        '''
+        Emit one `dataChanged` signal for each run of contiguous rows in a
+        column.
+        '''
+        if roles is None:
+            roles = []
+
+        runs = [] # [first_row, last_row]
+        for row in sorted(rows):
+            if runs and runs[-1][1] + 1 >= row:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+
+        for first_row, last_row in runs:
+            self.dataChanged.emit(
+                self.index(first_row, column), self.index(last_row, column), roles
+            )
+
     def append_data(self, dict_):
         self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount())
         self._data.append(dict_)
@@ -172,6 +227,52 @@ class TGTableModel(QAbstractTableModel):
             new_str = p.sub(repl, item_str)
             self.setData(index, new_str)
 
+    def replace_column(self, column, pattern, repl, rows=None):
+        '''
+        Replace the substrings matching a regex pattern in every cell of a
+        column.
+
+        The items are edited in place and the views are notified once for
+        each run of contiguous modified rows, instead of once per cell.
+
+        Parameters
+        ----------
+        column : int
+            The zero-based index of the column to search and modify.
+        pattern : str or re.Pattern
+            The regular expression (regex) pattern to search for.
+        repl : str
+            The replacement string.
+        rows : iterable of int, optional
+            The rows to process. If None, all the rows in the model.
+        '''
+        # Column 0 holds `pathlib.Path` objects. A negative column would
+        # index the rows from the end.
+        if not 1 <= column < self.columnCount():
+            return
+
+        p = re.compile(pattern)
+
+        if rows is None:
+            rows = range(len(self._data))
+
+        modified_rows = []
+        for irow in rows:
+            item = self._data[irow][column]
+            if item is None:
+                continue
+
+            item_str = item.text
+            new_str = p.sub(repl, item_str)
+            if new_str == item_str:
+                continue
+
+            item.text = new_str
+            item.modified = True
+            modified_rows.append(irow)
+
+        self._notify_rows(column, modified_rows)
+
     def replace_all(self, pattern, repl, src_column, dst_column=-1):
         '''
         Searches for a regex pattern in one column and replaces the matching
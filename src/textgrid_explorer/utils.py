@@ -13,51 +13,408 @@
 #
 #   You should have received a copy of the GNU General Public License along
 #   with this program.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import os
+import logging
+import bisect
+import codecs
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from pprint import pprint
 
 import mytextgrid
 
-def read_textgrid(path):
+log = logging.getLogger(__name__)
+
+# Worker processes are started with `spawn` on every platform: forking the
+# GUI process, which runs Qt threads, can deadlock. Starting the workers
+# costs about a second, so small corpora are read in this process.
+_MP_CONTEXT = multiprocessing.get_context('spawn')
+_PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+_MAX_CHUNKSIZE = 16
+
+# Tier names of the files read so far, keyed by path. Each entry holds the
+# modification time and size of the file, so an edited file is read again.
+# The least recently used entries come first.
+_TIER_NAMES_CACHE_SIZE = 4096
+_tier_names_cache = {}
+
+def read_textgrid(path, populate_items=True):
+    """
+    Read a TextGrid file and add the attributes used by the explorer.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        The path to the TextGrid file.
+    populate_items : bool, default True
+        If False, the intervals and points are left untouched. Use it when
+        only the tiers are needed.
+
+    Returns
+    -------
+    mytextgrid.TextGrid
+        The TextGrid, with a `file_path` attribute.
+    """
+    # Read the file once and detect the encoding on the buffer
+    path = Path(path)
+    data = path.read_bytes()
+    if data.isascii(): # Most TextGrid files; no detection needed
+        text = data.decode('ascii')
+    else:
+        encoding = _detect_encoding(io.BytesIO(data))
+        try:
+            text = data.decode(encoding)
+        except UnicodeDecodeError: # Only the start of the file was validated
+            text = data.decode('latin_1')
+
+    # Translate newlines like a file opened in text mode
+    stream = io.StringIO(text, newline=None)
+    tg = mytextgrid.read_from_stream(stream, name=path.stem, path=path)
+    tg.file_path = path
+    for index, tier in enumerate(tg):
+        tier.index = index
+        if not populate_items:
+            continue
+        for item in tier:
+            item.modified = False
+    return tg
+
+_TEXTGRID_SUFFIX = os.path.normcase('.TextGrid')
+
+def _iter_textgrids(root):
+    """
+    Yield the paths (as `str`) of the TextGrid files found under `root`,
+    recursively. The files of a directory come before those of its
+    subdirectories. The extension is compared with the case rules of the
+    platform, like `Path.rglob` does.
+    """
+    files = []
+    subdirs = []
     try:
-        encoding = detect_praat_encoding(path)
-        if encoding == '':
-            encoding = None
-
-        tg = mytextgrid.read_from_file(path, encoding=encoding)
-        tg.file_path = path
-        for index, tier in enumerate(tg):
-            tg.file_path = path
-            tier.index = index
-            for item in tier:
-                item.modified = False
-        return tg
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif (os.path.normcase(entry.name).endswith(_TEXTGRID_SUFFIX)
+                        and entry.is_file()):
+                    files.append(entry.path)
+    except OSError:
+        return
+
+    yield from files
+    for subdir in subdirs:
+        yield from _iter_textgrids(subdir)
+
+def _call(func, path):
+    try:
+        return func(path), None
     except Exception as e:
+        return None, e
+
+def _call_many(func, paths):
+    return [_call(func, path) for path in paths]
+
+def _map_textgrids(func, paths, max_workers=None):
+    """
+    Apply `func` to every TextGrid path using a pool of worker processes.
+
+    Parameters
+    ----------
+    func : callable
+        A module-level function (it must be picklable) that takes a path.
+    paths : iterable of str
+        The TextGrid paths.
+    max_workers : int, optional
+        The number of worker processes. If None, the number of CPUs. With a
+        single worker, or if the files add up to less than
+        `_PARALLEL_MIN_BYTES`, they are processed in the current process.
+
+    Yields
+    ------
+    tuple
+        `(path, result, error)` for each path, in the order of `paths`.
+        `error` is the exception raised by `func`, or None.
+
+    Notes
+    -----
+    Only about two batches of files per worker are submitted ahead of the
+    consumer. If the generator is closed early, the batches that have not
+    started are cancelled and it returns without waiting for the rest.
+
+    If a whole batch fails (e.g. a worker crashes), its error is reported
+    for each of its paths, as if `func` had raised it.
+    """
+    paths = list(paths)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(paths))
+    if max_workers > 1 and _total_size(paths) < _PARALLEL_MIN_BYTES:
+        max_workers = 1
+
+    if max_workers <= 1:
+        for path in paths:
+            yield (path, *_call(func, path))
+        return
+
+    # Several files per task, so small files do not each cost a round trip
+    chunksize = max(1, min(_MAX_CHUNKSIZE, len(paths) // (max_workers*4)))
+    batches = (paths[i:i + chunksize] for i in range(0, len(paths), chunksize))
+
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT)
+    pending = deque()
+
+    def submit(batch):
+        try:
+            future = executor.submit(_call_many, func, batch)
+        except Exception as e: # The pool is broken
+            future = Future()
+            future.set_exception(e)
+        pending.append((batch, future))
+
+    finished = False
+    try:
+        for batch in itertools.islice(batches, 2*max_workers):
+            submit(batch)
+
+        while pending:
+            batch, future = pending.popleft()
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(None, e)]*len(batch)
+
+            # Keep the workers busy while the results are consumed
+            for next_batch in itertools.islice(batches, 1):
+                submit(next_batch)
+
+            for path, (result, error) in zip(batch, results):
+                yield path, result, error
+        finished = True
+    finally:
+        # `cancel_futures` needs Python 3.9
+        for batch, future in pending:
+            future.cancel()
+        executor.shutdown(wait=finished)
+
+def _total_size(paths):
+    size = 0
+    for path in paths:
+        try:
+            size += os.stat(path).st_size
+        except OSError:
+            pass
+    return size
+
+def _best_overlap(starts, ends, xmin, xmax):
+    """
+    Find the interval that overlaps the most with the range [xmin, xmax].
+
+    Parameters
+    ----------
+    starts, ends : list
+        The start and end times of sorted, non-overlapping intervals.
+    xmin, xmax : decimal.Decimal
+        The time range to align.
+
+    Returns
+    -------
+    tuple or None
+        `(position, score)` of the best interval, or None if no interval
+        overlaps. Scores compare by overlap length and then prefer the
+        interval whose union with the range is shorter.
+    """
+    best = None
+    i = bisect.bisect_right(ends, xmin)
+    while i < len(starts) and starts[i] < xmax:
+        overlap = min(xmax, ends[i]) - max(xmin, starts[i])
+        union = max(xmax, ends[i]) - min(xmin, starts[i])
+        score = (overlap, -union)
+        if best is None or score > best[1]:
+            best = (i, score)
+        i += 1
+    return best
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _cached_tier_names(path, stamp):
+    """
+    Return the cached tier names of `path`, or None if they are missing or
+    the file changed since they were stored.
+    """
+    entry = _tier_names_cache.pop(path, None)
+    if entry is None or stamp is None or entry[0] != stamp:
         return None
+    _tier_names_cache[path] = entry # Move it to the end
+    return entry[1]
+
+def _cache_tier_names(path, stamp, tier_names):
+    if stamp is None:
+        return
+    _tier_names_cache.pop(path, None)
+    _tier_names_cache[path] = (stamp, tier_names)
+    while len(_tier_names_cache) > _TIER_NAMES_CACHE_SIZE:
+        del _tier_names_cache[next(iter(_tier_names_cache))]
+
+def _tier_names(path):
+    return [tier.name for tier in read_textgrid(path, populate_items=False)]
 
-def get_tier_names(source_dir):
+def get_tier_names(source_dir, max_workers=None):
     source_dir = Path(source_dir)
 
-    names = []
-    for path in source_dir.rglob('*.TextGrid'):
-        try:
-            tg = read_textgrid(path)
-        except Exception as e:
-            print(f'Could not read {path}: {e}')
+    # Only the files that are new or changed since the last call are read
+    paths = list(_iter_textgrids(source_dir))
+    stamps = {path: _file_stamp(path) for path in paths}
+    tier_names_of = {}
+    for path in paths:
+        tier_names = _cached_tier_names(path, stamps[path])
+        if tier_names is not None:
+            tier_names_of[path] = tier_names
+
+    pending = [path for path in paths if path not in tier_names_of]
+    for path, tier_names, e in _map_textgrids(_tier_names, pending, max_workers):
+        if e is not None:
+            log.warning('Could not read %s: %s', path, e)
+            continue
+
+        _cache_tier_names(path, stamps[path], tier_names)
+        tier_names_of[path] = tier_names
+
+    names = {} # Ordered set
+    for path in paths:
+        for name in tier_names_of.get(path, ()):
+            names.setdefault(name, None)
+    return list(names)
+
+def _align_rows(tg, primary_tier_name, col_of, blank):
+    """
+    Build the table rows of a TextGrid. Return None if the TextGrid has no
+    tier called `primary_tier_name`.
+    """
+    # Get the primary tier (the first one if the name is repeated)
+    primary_tier = next((tier for tier in tg if tier.name == primary_tier_name), None)
+    if primary_tier is None:
+        return None
+
+    # Only the requested secondary tiers, with their column index
+    secondary_tiers = [
+        (col_of[tier.name], tier) for tier in tg
+        if tier.name in col_of and tier is not primary_tier
+    ]
+
+    # The rows are in time order. `local_idx` maps the time range of each
+    # row to its position.
+    rows = []
+    starts = []
+    ends = []
+    local_idx = {}
+    for primary_interval in primary_tier:
+        # Empty intervals are the most common, so avoid stripping them
+        text = primary_interval.text
+        if not text or not text.strip():
             continue
 
-        for tier in tg:
-            name = tier.name
-            if name in names:
+        row = [tg.file_path, primary_interval, *blank]
+        local_idx[primary_interval.xmin, primary_interval.xmax] = len(rows)
+        starts.append(primary_interval.xmin)
+        ends.append(primary_interval.xmax)
+        rows.append(row)
+
+    # Each secondary interval goes to the row it overlaps the most. If
+    # several of them compete for the same cell, the best fit wins.
+    cell_scores = {}
+    for tier_index, tier in secondary_tiers:
+        for secondary_interval in tier:
+            xmin = secondary_interval.xmin
+            xmax = secondary_interval.xmax
+
+            # An interval with the same times is always the best fit
+            position = local_idx.get((xmin, xmax))
+            if position is not None:
+                score = (xmax - xmin, xmin - xmax)
+            else:
+                best = _best_overlap(starts, ends, xmin, xmax)
+                if best is None:
+                    continue
+                position, score = best
+
+            cell = (position, tier_index)
+            if cell in cell_scores and cell_scores[cell] >= score:
                 continue
-            names.append(name)
-    return names
+            cell_scores[cell] = score
+            rows[position][tier_index] = secondary_interval
+    return rows
 
-def create_aligned_tier_table(source_dir, primary_tier_name, secondary_tier_names):
+def iter_aligned_tier_table(source_dir, primary_tier_name, secondary_tier_names, max_workers=None):
+    """
+    Yield the rows of the aligned table one file at a time.
+
+    This is the streaming version of `create_aligned_tier_table`, which
+    describes the parameters and the layout of the rows. The rows of a file
+    are yielded as soon as it is processed, in the order of the files.
+
+    Yields
+    ------
+    list
+        A row: the file path, the primary interval and one secondary
+        interval (or None) per secondary tier.
+    """
+    # Ensure the source directory path is a Path object
+    source_dir = Path(source_dir)
+    if not source_dir.is_dir() or not source_dir.is_absolute():
+        return
+
+    # Column index of each secondary tier
+    col_of = {}
+    for i, name in enumerate(secondary_tier_names, 2):
+        col_of.setdefault(name, i)
+
+    # Rows stay plain lists: the table model indexes and edits them in place
+    blank = (None,)*len(secondary_tier_names)
+
+    # Files known (from `get_tier_names`) to lack the primary tier are
+    # skipped without being parsed
+    paths = []
+    stamps = {}
+    for path in _iter_textgrids(source_dir):
+        stamp = _file_stamp(path)
+        tier_names = _cached_tier_names(path, stamp)
+        if tier_names is not None and primary_tier_name not in tier_names:
+            log.warning('Primary tier "%s" not found in %s. Skipping.', primary_tier_name, path)
+            continue
+        paths.append(path)
+        stamps[path] = stamp
+
+    # Process each TextGrid file in the source directory. The files are
+    # parsed in parallel and sent back to this process.
+    for path, tg, e in _map_textgrids(read_textgrid, paths, max_workers):
+        if e is not None:
+            log.warning('Could not read %s: %s', path, e)
+            continue
+        _cache_tier_names(path, stamps[path], [tier.name for tier in tg])
+
+        rows = _align_rows(tg, primary_tier_name, col_of, blank)
+        if rows is None:
+            log.warning('Primary tier "%s" not found in %s. Skipping.', primary_tier_name, path)
+            continue
+        yield from rows
+
+def create_aligned_tier_table(source_dir, primary_tier_name, secondary_tier_names, max_workers=None):
     """
     Reads TextGrid files from a source directory, aligns them based on a
     primary tier's intervals, and organizes the data into a table.
 
+    Each row holds a non-empty primary interval. A secondary interval is
+    placed in the row of the primary interval it overlaps the most.
+
     Parameters
     ----------
     source_dir: str
@@ -66,6 +423,9 @@ def create_aligned_tier_table(source_dir, primary_tier_name, secondary_tier_name
         The name of the tier to use as the key for alignment.
     secondary_tier_names: list of str
         A list of names of the secondary tiers to align with the primary tier.
+    max_workers: int, optional
+        The number of processes used to parse the files. If None, the number
+        of CPUs.
 
     Returns
     -------
@@ -78,55 +438,10 @@ def create_aligned_tier_table(source_dir, primary_tier_name, secondary_tier_name
     if not source_dir.is_dir() or not source_dir.is_absolute():
         return [], []
 
-    # Initialize data structures
-    aligned_data = {}
     headers = ['filename', primary_tier_name] + secondary_tier_names
-
-    # Process each TextGrid file in the source directory
-    for path in source_dir.rglob('*.TextGrid'):
-        try:
-            tg = read_textgrid(path)
-        except Exception as e:
-            print(f'Could not read {path}: {e}')
-            continue
-
-        # Get the primary tier
-        for tier in tg:
-            primary_tiers = [tier for tier in tg if tier.name == primary_tier_name]
-            if not primary_tiers:
-                print(f'Primary tier "{primary_tier_name}" not found in {path}. Skipping.')
-                continue
-
-            primary_tier = primary_tiers[0]
-
-            for primary_interval in primary_tier:
-                if not primary_interval.text.strip():
-                    continue
-
-                interval_times = (primary_interval.xmin, primary_interval.xmax)
-
-                row = [None]*len(headers)
-                row[0] = path
-                row[1] = primary_interval
-
-                aligned_data[interval_times] = row
-
-            for tier in tg:
-                if tier == primary_tier:
-                    continue
-                if tier.name in secondary_tier_names:
-                    for secondary_interval in tier:
-                        interval_times = (secondary_interval.xmin, secondary_interval.xmax)
-
-                        if interval_times in aligned_data:
-                            try:
-                                tier_index = headers.index(tier.name)
-                                aligned_data[interval_times][tier_index] = secondary_interval
-                            except:
-                                continue
-    # Convert the dictionary of aligned data into a list of lists for the table model
-#    pprint(aligned_data)
-    table_rows = list(aligned_data.values())
+    table_rows = list(iter_aligned_tier_table(
+        source_dir, primary_tier_name, secondary_tier_names, max_workers
+    ))
     return headers, table_rows
 
 def detect_praat_encoding(path):
@@ -161,23 +476,49 @@ def detect_praat_encoding(path):
     old Mac -> \r
     """
     with open(path, 'rb') as f:
-        header = f.readline()
-
-        if header.startswith(b'\xff\xfe'):
-            return 'utf-16le'
-        elif header.startswith(b'\xfe\xff'):
-            return 'utf-16be'
-        else:
-            byte_sequence = f.read()
-            if _is_valid_utf8(byte_sequence):
-                return 'utf-8'
-            else:
-                return 'latin_1'
-    return ''
+        return _detect_encoding(f)
+
+def _detect_encoding(stream):
+    """
+    Detect the encoding of a binary stream positioned at the start of a
+    TextGrid. See `detect_praat_encoding`.
+    """
+    header = stream.read(2)
 
-def _is_valid_utf8(byte_sequence):
+    if header == b'\xff\xfe':
+        return 'utf-16le'
+    elif header == b'\xfe\xff':
+        return 'utf-16be'
+
+    if _is_valid_utf8(stream, prefix=header):
+        return 'utf-8'
+    else:
+        return 'latin_1'
+
+def _is_valid_utf8(stream, max_bytes=65536, chunk_size=8192, prefix=b''):
+    """
+    Check whether the first `max_bytes` of a binary stream are valid UTF-8.
+
+    The bytes are decoded incrementally, so memory use is bounded by
+    `chunk_size` whatever the size of the file. The rest of the stream is
+    assumed to have the same encoding. `prefix` holds the bytes already read
+    from the stream, so the caller does not need to rewind it.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+    remaining = max_bytes - len(prefix)
     try:
-        byte_sequence.decode('utf-8')
-        return True
-    except UnicodeError:
+        decoder.decode(prefix)
+        while remaining > 0:
+            chunk = stream.read(min(chunk_size, remaining))
+            if not chunk: # End of stream
+                decoder.decode(b'', final=True)
+                break
+            remaining -= len(chunk)
+
+            # Most TextGrid files are pure ASCII, which is also valid UTF-8
+            if chunk.isascii() and not decoder.getstate()[0]:
+                continue
+            decoder.decode(chunk)
+    except UnicodeDecodeError:
         return False
+    return True
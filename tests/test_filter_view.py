@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#   textgrid_explorer - A TextGrid editing tool with a spreadsheet interface
+#   Copyright (C) 2025 Rolando Muñoz <rolando.muar@gmail.com>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3, as published
+#   by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import sys
+from pathlib import Path
+
+package_dir = Path(__file__).parent.joinpath('..', 'src').resolve()
+sys.path.insert(0, str(package_dir))
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide6.QtWidgets import QApplication
+from PySide6.QtTest import QTest
+
+from textgrid_explorer.dialogs import FilterByDialog
+
+app = QApplication.instance() or QApplication([])
+
+def make_dialog(fields):
+    dlg = FilterByDialog(None, list(fields))
+    emitted = []
+    dlg.filtered_by.connect(emitted.append)
+    return dlg, emitted
+
+def test_changes_are_debounced_into_one_emission():
+    dlg, emitted = make_dialog(['filename', 'words'])
+    dlg.set_debounce_interval(10)
+    for text in ('a', 'ab', 'abc'):
+        dlg.line_ed.setText(text)
+    assert emitted == []
+
+    QTest.qWait(100)
+    assert [d['pattern'] for d in emitted] == ['abc']
+
+def test_unchanged_state_is_not_emitted_again():
+    dlg, emitted = make_dialog(['filename', 'words'])
+    dlg.line_ed.setText('a')
+    dlg._emit_now()
+    dlg._emit_now()
+    assert len(emitted) == 1
+
+    dlg.line_ed.setText('b')
+    dlg._emit_now()
+    assert [d['pattern'] for d in emitted] == ['a', 'b']
+
+def test_set_fields_keeps_common_prefix():
+    dlg, emitted = make_dialog(['filename', 'words', 'phones'])
+    dlg.set_index_field(1)
+    dlg._emit_now()
+
+    dlg.set_fields(['filename', 'words', 'notes', 'tones'])
+    items = [dlg.headers_box.itemText(i) for i in range(dlg.headers_box.count())]
+    assert items == ['filename', 'words', 'notes', 'tones']
+    assert dlg.fields() == items
+    assert dlg.headers_box.currentText() == 'words'
+
+    # The selected column did not change, so nothing is emitted
+    QTest.qWait(200)
+    assert len(emitted) == 1
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#   textgrid_explorer - A TextGrid editing tool with a spreadsheet interface
+#   Copyright (C) 2025 Rolando Muñoz <rolando.muar@gmail.com>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3, as published
+#   by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+package_dir = Path(__file__).parent.joinpath('..', 'src').resolve()
+sys.path.insert(0, str(package_dir))
+
+from textgrid_explorer.models import TGTableModel
+
+def item(text, modified=False):
+    return SimpleNamespace(text=text, modified=modified)
+
+def make_model(texts):
+    """
+    Build a model with a filename column and one column per text of each
+    row. None stands for an empty cell.
+    """
+    rows = [
+        [Path(f'f{i}.TextGrid')] + [None if t is None else item(t) for t in row]
+        for i, row in enumerate(texts)
+    ]
+    headers = ['filename'] + [f'tier{i}' for i in range(1, len(rows[0]))]
+    model = TGTableModel()
+    model.set_full_dataset(headers, rows)
+
+    emitted = []
+    model.dataChanged.connect(
+        lambda top_left, bottom_right, roles:
+            emitted.append((top_left.column(), top_left.row(), bottom_right.row()))
+    )
+    return model, emitted
+
+def column_texts(model, column):
+    return [model.index(row, column).data() for row in range(model.rowCount())]
+
+def test_replace_column_emits_runs_of_changed_rows():
+    model, emitted = make_model(
+        [['ab', 'x'], ['ab', 'x'], ['cd', 'x'], ['ab', 'x'], [None, 'x'], ['ab', 'x']]
+    )
+    model.replace_column(1, 'a', 'A')
+
+    assert column_texts(model, 1) == ['Ab', 'Ab', 'cd', 'Ab', '', 'Ab']
+    assert emitted == [(1, 0, 1), (1, 3, 3), (1, 5, 5)]
+    assert [r[1] is not None and r[1].modified for r in model.data_collection()] == [
+        True, True, False, True, False, True
+    ]
+    assert column_texts(model, 2) == ['x']*6
+
+def test_replace_column_restricted_to_rows():
+    model, emitted = make_model([['ab'], ['ab'], ['ab'], ['ab']])
+    model.replace_column(1, 'a', 'A', rows=[3, 1, 2])
+
+    assert column_texts(model, 1) == ['ab', 'Ab', 'Ab', 'Ab']
+    assert emitted == [(1, 1, 3)]
+
+def test_replace_column_ignores_invalid_columns():
+    model, emitted = make_model([['ab', 'ef'], ['ab', 'ef']])
+    for column in (0, -1, 3, 10):
+        model.replace_column(column, 'e', 'X')
+
+    assert column_texts(model, 1) == ['ab', 'ab']
+    assert column_texts(model, 2) == ['ef', 'ef']
+    assert emitted == []
+
+def test_clear_modified_flags():
+    model, emitted = make_model([['a', 'b'], ['a', 'b'], ['a', 'b']])
+    model.replace_column(1, 'a', 'A')
+    model.replace_column(2, 'b', 'B')
+    emitted.clear()
+
+    model.clear_modified_flags([(2, 1), (0, 1), (1, 2)])
+
+    rows = model.data_collection()
+    assert [row[1].modified for row in rows] == [False, True, False]
+    assert [row[2].modified for row in rows] == [True, False, True]
+    assert sorted(emitted) == [(1, 0, 0), (1, 2, 2), (2, 1, 1)]
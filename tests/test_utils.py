@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#   textgrid_explorer - A TextGrid editing tool with a spreadsheet interface
+#   Copyright (C) 2025 Rolando Muñoz <rolando.muar@gmail.com>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3, as published
+#   by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import os
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+package_dir = Path(__file__).parent.joinpath('..', 'src').resolve()
+sys.path.insert(0, str(package_dir))
+
+import mytextgrid
+
+from textgrid_explorer import utils
+
+def write_textgrid(path, xmax, tiers):
+    """
+    Write a TextGrid with interval tiers. `tiers` is a list of
+    `(name, boundaries, texts)`, with one more text than boundaries.
+    """
+    tg = mytextgrid.create_textgrid(0, Decimal(xmax))
+    for name, boundaries, texts in tiers:
+        tier = tg.insert_tier(name)
+        tier.insert_boundaries(*[Decimal(t) for t in boundaries])
+        for i, text in enumerate(texts):
+            tier.set_text_at_index(i, text)
+    tg.write(path)
+
+def aligned_texts(source_dir, primary_tier_name, secondary_tier_names):
+    headers, rows = utils.create_aligned_tier_table(
+        source_dir, primary_tier_name, secondary_tier_names, max_workers=1
+    )
+    return [
+        [Path(row[0]).name] + [None if cell is None else cell.text for cell in row[1:]]
+        for row in rows
+    ]
+
+def times(*values):
+    return [Decimal(v) for v in values]
+
+# Overlap alignment
+
+def test_best_overlap_prefers_exact_match():
+    starts, ends = times('0', '1'), times('1', '2')
+    position, score = utils._best_overlap(starts, ends, Decimal('1'), Decimal('2'))
+    assert position == 1
+
+def test_best_overlap_breaks_ties_on_shorter_union():
+    # [0.5, 1.5] overlaps both intervals by 0.5
+    starts, ends = times('0', '1'), times('1', '3')
+    position, score = utils._best_overlap(starts, ends, Decimal('0.5'), Decimal('1.5'))
+    assert position == 0
+
+def test_best_overlap_excludes_touching_intervals():
+    starts, ends = times('0', '2'), times('1', '3')
+    assert utils._best_overlap(starts, ends, Decimal('1'), Decimal('2')) is None
+
+def test_align_by_overlap(tmp_path):
+    write_textgrid(tmp_path / 'f.TextGrid', 4, [
+        ('words', ['1', '2', '3'], ['a', '', 'b', 'c']),
+        ('phones', ['1', '1.2', '1.8', '2.2', '3.5'], ['x', 'y', 'z', 'p', 'q', 'r']),
+    ])
+    # `y` touches `a` and, like `z`, lies in the skipped empty interval.
+    # `p` and `q` compete for `b`; `q` overlaps it the most.
+    assert aligned_texts(tmp_path, 'words', ['phones']) == [
+        ['f.TextGrid', 'a', 'x'],
+        ['f.TextGrid', 'b', 'q'],
+        ['f.TextGrid', 'c', 'r'],
+    ]
+
+def test_exact_match_beats_partial_overlap(tmp_path):
+    # Both tiers are called `phones`, so they compete for the same column.
+    # The partial overlap comes first and is replaced by the exact match.
+    write_textgrid(tmp_path / 'f.TextGrid', 2, [
+        ('words', ['1'], ['a', 'b']),
+        ('phones', ['0.8'], ['partial', '']),
+        ('phones', ['1'], ['exact', '']),
+    ])
+    assert aligned_texts(tmp_path, 'words', ['phones']) == [
+        ['f.TextGrid', 'a', 'exact'],
+        ['f.TextGrid', 'b', ''],
+    ]
+
+def test_files_with_identical_times_keep_their_rows(tmp_path):
+    for name in ('f1', 'f2'):
+        write_textgrid(tmp_path / f'{name}.TextGrid', 2, [
+            ('words', ['1'], [f'{name}_a', f'{name}_b']),
+            ('phones', ['1'], [f'{name}_x', f'{name}_y']),
+        ])
+    rows = aligned_texts(tmp_path, 'words', ['phones'])
+    assert sorted(rows) == [
+        ['f1.TextGrid', 'f1_a', 'f1_x'],
+        ['f1.TextGrid', 'f1_b', 'f1_y'],
+        ['f2.TextGrid', 'f2_a', 'f2_x'],
+        ['f2.TextGrid', 'f2_b', 'f2_y'],
+    ]
+
+# Tier name cache
+
+def test_cached_file_without_primary_tier_is_not_parsed(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_tier_names_cache', {})
+    write_textgrid(tmp_path / 'a.TextGrid', 1, [('words', [], ['a'])])
+    write_textgrid(tmp_path / 'b.TextGrid', 1, [('notes', [], ['b'])])
+    assert sorted(utils.get_tier_names(tmp_path, max_workers=1)) == ['notes', 'words']
+
+    parsed = []
+    read_textgrid = utils.read_textgrid
+    def recording_read_textgrid(path, *args, **kwargs):
+        parsed.append(Path(path).name)
+        return read_textgrid(path, *args, **kwargs)
+    monkeypatch.setattr(utils, 'read_textgrid', recording_read_textgrid)
+
+    assert aligned_texts(tmp_path, 'words', []) == [['a.TextGrid', 'a']]
+    assert parsed == ['a.TextGrid']
+
+def test_changed_file_is_parsed_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_tier_names_cache', {})
+    path = tmp_path / 'f.TextGrid'
+    write_textgrid(path, 1, [('notes', [], ['a'])])
+    stat = os.stat(path)
+    assert utils.get_tier_names(tmp_path, max_workers=1) == ['notes']
+    assert aligned_texts(tmp_path, 'words', []) == []
+
+    # Same size, new modification time
+    write_textgrid(path, 1, [('words', [], ['a'])])
+    assert os.stat(path).st_size == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert aligned_texts(tmp_path, 'words', []) == [['f.TextGrid', 'a']]
+
+    # Same modification time, new size
+    write_textgrid(path, 1, [('notes', [], ['a'])])
+    utils.get_tier_names(tmp_path, max_workers=1)
+    stat = os.stat(path)
+    write_textgrid(path, 1, [('words', [], ['abc'])])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert aligned_texts(tmp_path, 'words', []) == [['f.TextGrid', 'abc']]
+
+def test_tier_name_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(utils, '_tier_names_cache', {})
+    monkeypatch.setattr(utils, '_TIER_NAMES_CACHE_SIZE', 2)
+    stamp = (1, 1)
+    utils._cache_tier_names('a', stamp, ['words'])
+    utils._cache_tier_names('b', stamp, ['words'])
+    assert utils._cached_tier_names('a', stamp) == ['words'] # `a` is used
+    utils._cache_tier_names('c', stamp, ['words'])
+
+    assert utils._cached_tier_names('b', stamp) is None
+    assert utils._cached_tier_names('a', stamp) == ['words']
+    assert utils._cached_tier_names('c', stamp) == ['words']
+    assert utils._cached_tier_names('a', (2, 1)) is None
+
+# UTF-8 validation
+
+def test_utf8_sequence_split_across_chunks():
+    data = b'a'*8191 + 'é'.encode('utf-8') + b'b'
+    assert utils._is_valid_utf8(io.BytesIO(data), chunk_size=8192)
+
+def test_invalid_utf8_after_ascii_chunk():
+    data = b'a'*8192 + b'\xe9b'
+    assert not utils._is_valid_utf8(io.BytesIO(data), chunk_size=8192)
+
+def test_truncated_utf8_at_end_of_stream():
+    assert not utils._is_valid_utf8(io.BytesIO(b'a\xc3'))
+
+def test_utf8_sequence_split_by_prefix():
+    # The BOM probe read the first byte of `é` already
+    assert utils._is_valid_utf8(io.BytesIO(b'\xa9abc'), prefix=b'\xc3')
+    assert not utils._is_valid_utf8(io.BytesIO(b'abc'), prefix=b'\xc3')
+
+def test_detect_praat_encoding(tmp_path):
+    path = tmp_path / 'f.TextGrid'
+    path.write_bytes(b'a'*8191 + 'é'.encode('utf-8'))
+    assert utils.detect_praat_encoding(path) == 'utf-8'
+    path.write_bytes(b'a'*8191 + 'é'.encode('latin_1'))
+    assert utils.detect_praat_encoding(path) == 'latin_1'
+    path.write_bytes('é'.encode('utf-16'))
+    assert utils.detect_praat_encoding(path) in ('utf-16le', 'utf-16be')
+
+# Parallel parsing
+
+def crash(path):
+    os._exit(1)
+
+
+def test_closing_the_table_iterator_returns_promptly(tmp_path, monkeypatch):
+    write_textgrid(tmp_path / 'f.TextGrid', 500, [
+        ('words', [str(t) for t in range(1, 500)], ['w']*500),
+    ])
+    data = (tmp_path / 'f.TextGrid').read_bytes()
+    for i in range(400):
+        (tmp_path / f'f{i:03}.TextGrid').write_bytes(data)
+    monkeypatch.setattr(utils, '_PARALLEL_MIN_BYTES', 0)
+
+    it = utils.iter_aligned_tier_table(tmp_path, 'words', [], max_workers=2)
+    assert next(it) is not None
+
+    start = time.perf_counter()
+    it.close()
+    assert time.perf_counter() - start < 2
+
+def test_worker_crash_is_reported_per_path(tmp_path, monkeypatch):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f'f{i}.TextGrid'
+        write_textgrid(path, 1, [('words', [], ['a'])])
+        paths.append(str(path))
+    monkeypatch.setattr(utils, '_PARALLEL_MIN_BYTES', 0)
+
+    results = list(utils._map_textgrids(crash, paths, max_workers=2))
+    assert [path for path, result, error in results] == paths
+    assert all(result is None and error is not None for path, result, error in results)